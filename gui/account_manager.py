@@ -180,3 +180,7 @@ def list_accounts_data():
     # Sort by last used time in descending order
     data.sort(key=lambda x: x.get("last_used", ""), reverse=True)
     return data
+
+def list_account_ids():
+    """Get the set of account IDs (for existence checks, no sorting)"""
+    return frozenset(load_accounts())
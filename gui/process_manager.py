@@ -1,49 +1,328 @@
 # -*- coding: utf-8 -*-
 import os
+import re
 import time
+import signal
 import platform
 import subprocess
+import threading
 import psutil
 
 # Use relative imports
 from utils import info, error, warning, get_antigravity_executable_path, open_uri
 
-def is_process_running(process_name=None):
-    """Check if the Antigravity process is running
+# Platform name, resolved once since platform.system() may spawn uname
+_SYSTEM = platform.system()
+
+# PIDs that belong to the manager itself (self and its non-Antigravity children)
+# Refreshed by _refresh_self_pids at the start of close_antigravity
+_self_pids = {os.getpid()}
+
+# Windows process creation settings, built once and reused for every call
+# The hidden STARTUPINFO is only for console helpers (taskkill), not for Antigravity itself
+_WIN_CREATE_NO_WINDOW = 0x08000000
+_WIN_STARTUPINFO = None
+if _SYSTEM == "Windows":
+    _WIN_STARTUPINFO = subprocess.STARTUPINFO()
+    _WIN_STARTUPINFO.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+# Launched Antigravity is fully detached: own session/process group, no inherited handles or stdio
+_WIN_CREATE_NEW_PROCESS_GROUP = 0x00000200
+_WIN_DETACHED_PROCESS = 0x00000008
+_POSIX_DETACHED_POPEN_KWARGS = {
+    'start_new_session': True,
+    'stdin': subprocess.DEVNULL,
+    'stdout': subprocess.DEVNULL,
+    'stderr': subprocess.DEVNULL,
+    'close_fds': True,
+}
+
+# Per-platform detectors, compiled once and matched against the raw (non-lowercased) strings
+# Process names that identify Antigravity without looking at the path
+_NAME_DETECTORS = {
+    'Darwin': re.compile(r'antigravity', re.I).fullmatch,
+    'Windows': re.compile(r'antigravity(\.exe)?', re.I).fullmatch,
+    'Linux': re.compile(r'antigravity', re.I).fullmatch,
+}
+# Executable paths that belong to Antigravity
+# Windows: Path contains antigravity but is not Antigravity Manager
+# Linux: Never consulted on Linux itself (the /proc scan matches comm only), kept as
+#        the default for other platforms whose candidates come from psutil
+_PATH_DETECTORS = {
+    'Darwin': re.compile(r'antigravity\.app', re.I).search,
+    'Windows': re.compile(r'antigravity(?!.*manager)', re.I).search,
+    'Linux': re.compile(r'antigravity', re.I).search,
+}
+_is_target_name = _NAME_DETECTORS.get(_SYSTEM, _NAME_DETECTORS['Linux'])
+_is_target_path = _PATH_DETECTORS.get(_SYSTEM, _PATH_DETECTORS['Linux'])
+
+def _iter_antigravity_pids_linux():
+    """Yield (pid, name, exe_path) of Antigravity processes by reading /proc directly
+
+    Much cheaper than psutil.process_iter: /proc is walked once with scandir
+    (no stat per entry) and only /proc/<pid>/comm is read for every process.
+    Matches are yielded as they are found; exe_path is left empty because the
+    name alone identifies Antigravity (it is resolved lazily when needed).
+    """
+    with os.scandir('/proc') as it:
+        for entry in it:
+            if not entry.name.isdigit():
+                continue
+            try:
+                # Unbuffered read, comm is at most 16 bytes
+                fd = os.open(f'/proc/{entry.name}/comm', os.O_RDONLY)
+                try:
+                    comm = os.read(fd, 64).strip()
+                finally:
+                    os.close(fd)
+            except OSError:
+                # Process exited or is not accessible
+                continue
+
+            if comm.lower() == b'antigravity':
+                yield int(entry.name), comm.decode(errors='replace'), ""
+
+def _list_windows_pids_by_name(name):
+    """Yield PIDs whose image name equals name (case-insensitive) on Windows
+
+    Takes a single CreateToolhelp32Snapshot instead of opening every
+    process as psutil.process_iter does.
+    """
+    import ctypes
+    from ctypes import wintypes
+
+    TH32CS_SNAPPROCESS = 0x00000002
+    INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+    class PROCESSENTRY32(ctypes.Structure):
+        _fields_ = [
+            ('dwSize', wintypes.DWORD),
+            ('cntUsage', wintypes.DWORD),
+            ('th32ProcessID', wintypes.DWORD),
+            ('th32DefaultHeapID', ctypes.c_size_t),
+            ('th32ModuleID', wintypes.DWORD),
+            ('cntThreads', wintypes.DWORD),
+            ('th32ParentProcessID', wintypes.DWORD),
+            ('pcPriClassBase', wintypes.LONG),
+            ('dwFlags', wintypes.DWORD),
+            ('szExeFile', ctypes.c_char * 260),
+        ]
+
+    kernel32 = ctypes.windll.kernel32
+    kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+    kernel32.CreateToolhelp32Snapshot.argtypes = [wintypes.DWORD, wintypes.DWORD]
+    kernel32.Process32First.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32)]
+    kernel32.Process32Next.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32)]
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+
+    snapshot = kernel32.CreateToolhelp32Snapshot(TH32CS_SNAPPROCESS, 0)
+    if not snapshot or snapshot == INVALID_HANDLE_VALUE:
+        raise OSError("CreateToolhelp32Snapshot failed")
+
+    target = name.lower().encode()
+    try:
+        entry = PROCESSENTRY32()
+        entry.dwSize = ctypes.sizeof(PROCESSENTRY32)
+        ok = kernel32.Process32First(snapshot, ctypes.byref(entry))
+        while ok:
+            if entry.szExeFile.lower() == target:
+                yield entry.th32ProcessID
+            ok = kernel32.Process32Next(snapshot, ctypes.byref(entry))
+    finally:
+        kernel32.CloseHandle(snapshot)
+
+def _procs_from_entries(entries):
+    """Yield psutil.Process objects for pre-filtered (pid, name, exe_path) entries only"""
+    for pid, name, exe_path in entries:
+        try:
+            proc = psutil.Process(pid)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        # Same shape as the attrs filled in by psutil.process_iter
+        proc.info = {'pid': pid, 'name': name, 'exe': exe_path}
+        yield proc
+
+def _iter_antigravity_procs_windows():
+    """Yield psutil.Process objects for Antigravity.exe processes on Windows"""
+    pids = list(_list_windows_pids_by_name("Antigravity.exe"))
+    return _procs_from_entries((pid, "Antigravity.exe", "") for pid in pids)
+
+# Short-lived cache of the detected Antigravity processes, shared by
+# is_process_running and close_antigravity to avoid walking the process table twice
+_snap = {'t': 0, 'procs': []}
+_snap_lock = threading.Lock()
+_SNAPSHOT_TTL = 1.0
+
+def _iter_candidate_procs():
+    """Get candidate processes for detection, pre-filtered where the platform allows it"""
+    if _SYSTEM == "Linux":
+        # Linux: Only the pre-filtered PIDs are turned into psutil.Process objects
+        return _procs_from_entries(_iter_antigravity_pids_linux())
+    if _SYSTEM == "Windows":
+        # Windows: One Toolhelp snapshot instead of opening every process
+        try:
+            return _iter_antigravity_procs_windows()
+        except Exception as e:
+            warning(f"Process snapshot failed: {e}, falling back to psutil")
+
+    # Only request the name; exe is resolved lazily since it costs an extra syscall per process
+    return psutil.process_iter(['pid', 'name'])
+
+def _is_antigravity(name, exe_path):
+    """Check whether a process name or executable path belongs to Antigravity
 
     Uses cross-platform detection:
-    - macOS: Check if path contains Antigravity.app
-    - Windows: Check process name or path contains antigravity
-    - Linux: Check process name or path contains antigravity
+    - macOS: Check process name or path contains Antigravity.app
+    - Windows: Check process name is Antigravity.exe, or path contains antigravity
+      (excluding Antigravity Manager)
+    - Linux: Check process name is antigravity (read from /proc)
     """
-    system = platform.system()
+    return bool(_is_target_name(name) or (exe_path and _is_target_path(exe_path)))
+
+def _collect_antigravity_procs():
+    """Collect running Antigravity processes (excluding self)
 
-    for proc in psutil.process_iter(['name', 'exe']):
+    Returns:
+        list: psutil.Process objects with 'pid', 'name' and 'exe' in proc.info
+    """
+    target_processes = []
+    for proc in _iter_candidate_procs():
         try:
-            process_name_lower = proc.info['name'].lower() if proc.info['name'] else ""
-            exe_path = proc.info.get('exe', '').lower() if proc.info.get('exe') else ""
-
-            # Cross-platform detection
-            is_antigravity = False
-
-            if system == "Darwin":
-                # macOS: Check if path contains Antigravity.app
-                is_antigravity = 'antigravity.app' in exe_path
-            elif system == "Windows":
-                # Windows: Check process name or path contains antigravity
-                is_antigravity = (process_name_lower in ['antigravity.exe', 'antigravity'] or
-                                 'antigravity' in exe_path)
+            # Exclude self and child processes
+            if proc.pid in _self_pids:
+                continue
+
+            name = proc.info['name'] or ""
+            exe_path = proc.info.get('exe') or ""
+            # Only resolve the executable path (extra syscall) when the name is inconclusive
+            if not exe_path and not _is_target_name(name):
+                exe_path = proc.exe() or ""
+
+            if _is_antigravity(name, exe_path):
+                proc.info['exe'] = exe_path
+                target_processes.append(proc)
+
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+
+    return target_processes
+
+def _refresh_self_pids():
+    """Rebuild _self_pids from the current process tree
+
+    Children that are Antigravity themselves (e.g. launched via start_antigravity)
+    are not counted as part of the manager, so they can still be closed.
+    """
+    global _self_pids
+    pids = {os.getpid()}
+    try:
+        for child in psutil.Process(os.getpid()).children(recursive=True):
+            try:
+                if not _is_target_name(child.name()):
+                    pids.add(child.pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        pass
+    _self_pids = pids
+
+def _snapshot_antigravity_procs(ttl=_SNAPSHOT_TTL):
+    """Return the detected Antigravity processes, reusing the last scan if younger than ttl seconds"""
+    # The lock is held across the scan so an invalidation issued meanwhile
+    # (e.g. right after signalling) cannot be overwritten by a stale result
+    with _snap_lock:
+        if time.monotonic() - _snap['t'] < ttl:
+            return _snap['procs']
+
+        _snap['procs'] = _collect_antigravity_procs()
+        _snap['t'] = time.monotonic()
+        return _snap['procs']
+
+def _invalidate_snapshot():
+    """Drop the cached process snapshot (after processes were signalled or launched)"""
+    with _snap_lock:
+        _snap['t'] = 0
+        _snap['procs'] = []
+
+def is_process_running(process_name=None):
+    """Check if the Antigravity process is running
+
+    Detection rules are described in _is_antigravity; the result is served
+    from a short-lived snapshot shared with close_antigravity.
+    """
+    return bool(_snapshot_antigravity_procs())
+
+def _signal_procs(procs, force=False):
+    """Send SIGTERM (or SIGKILL if force) to procs using as few calls as possible
+
+    - POSIX: One os.killpg per process group led by a target process
+    - Windows: Force kill uses a single taskkill /F /T call
+    Processes not covered by a batched call are signalled individually.
+    """
+    remaining = list(procs)
+
+    if _SYSTEM == "Windows":
+        if force and remaining:
+            try:
+                result = subprocess.run(
+                    ["taskkill", "/F", "/T", "/IM", "Antigravity.exe"],
+                    capture_output=True,
+                    timeout=5,
+                    startupinfo=_WIN_STARTUPINFO,
+                    creationflags=_WIN_CREATE_NO_WINDOW
+                )
+                if result.returncode == 0:
+                    # taskkill /IM only covers processes with that image name
+                    remaining = [p for p in remaining
+                                 if (p.info.get('name') or "").lower() != 'antigravity.exe']
+                else:
+                    warning(f"taskkill force kill failed (exit code {result.returncode}), "
+                            "killing processes one by one")
+            except Exception as e:
+                warning(f"taskkill force kill failed: {e}, killing processes one by one")
+    else:
+        sig = signal.SIGKILL if force else signal.SIGTERM
+        target_pids = {p.pid for p in remaining}
+        own_pgid = os.getpgid(0)
+
+        # Group by process group; only groups led by a target (and not our own) are signalled as a whole
+        groups = {}
+        ungrouped = []
+        for proc in remaining:
+            try:
+                pgid = os.getpgid(proc.pid)
+            except ProcessLookupError:
+                # Process already exited
+                continue
+            except OSError:
+                # Group unknown, signal this process individually
+                ungrouped.append(proc)
+                continue
+            if pgid != own_pgid and pgid in target_pids:
+                groups.setdefault(pgid, []).append(proc)
             else:
-                # Linux: Check process name or path contains antigravity
-                is_antigravity = (process_name_lower == 'antigravity' or
-                                 'antigravity' in exe_path)
+                ungrouped.append(proc)
 
-            if is_antigravity:
-                return True
+        remaining = ungrouped
+        for pgid, members in groups.items():
+            try:
+                os.killpg(pgid, sig)
+            except OSError:
+                # Includes ProcessLookupError: members may have changed group, signal them individually
+                # (the per-process loop skips those that are really gone)
+                remaining.extend(members)
 
+    for proc in remaining:
+        try:
+            if proc.is_running():
+                if force:
+                    proc.kill()
+                else:
+                    proc.terminate()
         except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
-    return False
+            continue
+        except Exception:
+            continue
 
 def close_antigravity(timeout=10, force_kill=True):
     """Gracefully close all Antigravity processes
@@ -57,15 +336,24 @@ def close_antigravity(timeout=10, force_kill=True):
     3. Force kill (SIGKILL/taskkill /F) - last resort
     """
     info("Attempting to close Antigravity...")
-    system = platform.system()
 
     # Platform check
-    if system not in ["Darwin", "Windows", "Linux"]:
-        warning(f"Unknown platform: {system}, will try generic method")
+    if _SYSTEM not in ["Darwin", "Windows", "Linux"]:
+        warning(f"Unknown platform: {_SYSTEM}, will try generic method")
+
+    _refresh_self_pids()
 
     try:
+        # Nothing to do if Antigravity is not running
+        # Always rescan: a cached "not running" may predate a launch, and callers
+        # such as switch_account overwrite data once this returns True
+        _invalidate_snapshot()
+        if not is_process_running():
+            info("Antigravity is not running, nothing to close")
+            return True
+
         # Phase 1: Platform-specific graceful exit
-        if system == "Darwin":
+        if _SYSTEM == "Darwin":
             # macOS: Use AppleScript
             info("Attempting graceful exit via AppleScript...")
             try:
@@ -76,26 +364,25 @@ def close_antigravity(timeout=10, force_kill=True):
                 )
                 if result.returncode == 0:
                     info("Quit request sent, waiting for app to respond...")
+                    _invalidate_snapshot()
                     time.sleep(2)
             except Exception as e:
                 warning(f"AppleScript quit failed: {e}, will use other methods")
 
-        elif system == "Windows":
+        elif _SYSTEM == "Windows":
             # Windows: Use taskkill for graceful termination (without /F flag)
             info("Attempting graceful exit via taskkill...")
             try:
-                # CREATE_NO_WINDOW = 0x08000000
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
                 result = subprocess.run(
                     ["taskkill", "/IM", "Antigravity.exe", "/T"],
                     capture_output=True,
                     timeout=3,
-                    creationflags=0x08000000
+                    startupinfo=_WIN_STARTUPINFO,
+                    creationflags=_WIN_CREATE_NO_WINDOW
                 )
                 if result.returncode == 0:
                     info("Quit request sent, waiting for app to respond...")
+                    _invalidate_snapshot()
                     time.sleep(2)
             except Exception as e:
                 warning(f"taskkill quit failed: {e}, will use other methods")
@@ -103,53 +390,16 @@ def close_antigravity(timeout=10, force_kill=True):
         # Linux doesn't need special handling, uses SIGTERM directly
 
         # Check and collect processes still running
-        target_processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'exe']):
-            try:
-                process_name_lower = proc.info['name'].lower() if proc.info['name'] else ""
-                exe_path = proc.info.get('exe', '').lower() if proc.info.get('exe') else ""
-
-                # Exclude self process
-                if proc.pid == os.getpid():
-                    continue
-
-                # Exclude all processes in current app directory (prevent killing self and child processes)
-                # In PyInstaller packaged environment, sys.executable points to the exe file
-                # In development environment, it points to python.exe
+        # The snapshot may predate the _self_pids refresh, filter again
+        target_processes = [p for p in _snapshot_antigravity_procs() if p.pid not in _self_pids]
+        for proc in target_processes:
+            # Name matches skip exe resolution during detection, resolve it for the log only
+            if not proc.info['exe']:
                 try:
-                    import sys
-                    current_exe = sys.executable
-                    current_dir = os.path.dirname(os.path.abspath(current_exe)).lower()
-                    if exe_path and current_dir in exe_path:
-                        continue
-                except:
+                    proc.info['exe'] = proc.exe()
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
                     pass
-
-                # Cross-platform detection: check process name or executable path
-                is_antigravity = False
-
-                if system == "Darwin":
-                    # macOS: Check if path contains Antigravity.app
-                    is_antigravity = 'antigravity.app' in exe_path
-                elif system == "Windows":
-                    # Windows: Strict match process name antigravity.exe
-                    # Or path contains antigravity and process name is not Antigravity Manager.exe
-                    is_target_name = process_name_lower in ['antigravity.exe', 'antigravity']
-                    is_in_path = 'antigravity' in exe_path
-                    is_manager = 'manager' in process_name_lower
-
-                    is_antigravity = is_target_name or (is_in_path and not is_manager)
-                else:
-                    # Linux: Check process name or path contains antigravity
-                    is_antigravity = (process_name_lower == 'antigravity' or
-                                     'antigravity' in exe_path)
-
-                if is_antigravity:
-                    info(f"Found target process: {proc.info['name']} ({proc.pid}) - {exe_path}")
-                    target_processes.append(proc)
-
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
+            info(f"Found target process: {proc.info['name']} ({proc.pid}) - {proc.info['exe']}")
 
         if not target_processes:
             info("All Antigravity processes have been closed")
@@ -159,32 +409,17 @@ def close_antigravity(timeout=10, force_kill=True):
 
         # Phase 2: Gently request process termination (SIGTERM)
         info("Sending termination signal (SIGTERM)...")
-        for proc in target_processes:
-            try:
-                if proc.is_running():
-                    proc.terminate()
-            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
-                continue
-            except Exception as e:
-                continue
+        _signal_procs(target_processes, force=False)
+        _invalidate_snapshot()
 
         # Wait for processes to terminate naturally
         info(f"Waiting for processes to exit (up to {timeout} seconds)...")
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            still_running = []
-            for proc in target_processes:
-                try:
-                    if proc.is_running():
-                        still_running.append(proc)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
+        # wait_procs returns as soon as every process has exited
+        _, still_running = psutil.wait_procs(target_processes, timeout=timeout)
 
-            if not still_running:
-                info("All Antigravity processes have been closed")
-                return True
-
-            time.sleep(0.5)
+        if not still_running:
+            info("All Antigravity processes have been closed")
+            return True
 
         # Phase 3: Force kill stubborn processes (SIGKILL)
         if still_running:
@@ -193,22 +428,11 @@ def close_antigravity(timeout=10, force_kill=True):
 
             if force_kill:
                 info("Sending force kill signal (SIGKILL)...")
-                for proc in still_running:
-                    try:
-                        if proc.is_running():
-                            proc.kill()
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        continue
+                _signal_procs(still_running, force=True)
+                _invalidate_snapshot()
 
                 # Final check
-                time.sleep(1)
-                final_check = []
-                for proc in still_running:
-                    try:
-                        if proc.is_running():
-                            final_check.append(proc)
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        continue
+                _, final_check = psutil.wait_procs(still_running, timeout=1)
 
                 if not final_check:
                     info("All Antigravity processes have been terminated")
@@ -235,7 +459,6 @@ def start_antigravity(use_uri=True):
                  URI protocol is more reliable and doesn't need executable path lookup
     """
     info("Starting Antigravity...")
-    system = platform.system()
 
     try:
         # Prefer URI protocol launch (cross-platform)
@@ -244,6 +467,7 @@ def start_antigravity(use_uri=True):
             uri = "antigravity://oauth-success"
 
             if open_uri(uri):
+                _invalidate_snapshot()
                 info("Antigravity URI launch command sent")
                 return True
             else:
@@ -252,20 +476,24 @@ def start_antigravity(use_uri=True):
 
         # Fallback: Launch using executable path
         info("Launching via executable path...")
-        if system == "Darwin":
-            subprocess.Popen(["open", "-a", "Antigravity"])
-        elif system == "Windows":
+        if _SYSTEM == "Darwin":
+            subprocess.Popen(["open", "-a", "Antigravity"], **_POSIX_DETACHED_POPEN_KWARGS)
+        elif _SYSTEM == "Windows":
             path = get_antigravity_executable_path()
             if path and path.exists():
-                # CREATE_NO_WINDOW = 0x08000000
-                subprocess.Popen([str(path)], creationflags=0x08000000)
+                # DETACHED_PROCESS already implies no console window
+                subprocess.Popen(
+                    [str(path)],
+                    creationflags=_WIN_CREATE_NEW_PROCESS_GROUP | _WIN_DETACHED_PROCESS
+                )
             else:
                 error("Antigravity executable not found")
                 warning("Hint: Try using URI protocol to launch (use_uri=True)")
                 return False
-        elif system == "Linux":
-            subprocess.Popen(["antigravity"])
+        elif _SYSTEM == "Linux":
+            subprocess.Popen(["antigravity"], **_POSIX_DETACHED_POPEN_KWARGS)
 
+        _invalidate_snapshot()
         info("Antigravity launch command sent")
         return True
     except Exception as e:
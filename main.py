@@ -11,6 +11,7 @@ try:
     from gui.utils import info, error, warning
     from gui.account_manager import (
         list_accounts_data,
+        list_account_ids,
         add_account_snapshot,
         switch_account,
         delete_account
@@ -87,7 +88,7 @@ def switch_account_interactive():
         warning("Operation cancelled")
         return
 
-    real_id = resolve_id(choice)
+    real_id = resolve_id(choice, accounts)
     if not real_id:
         error(f"❌ Invalid number: {choice}")
         return
@@ -114,7 +115,7 @@ def delete_account_interactive():
         warning("Operation cancelled")
         return
 
-    real_id = resolve_id(choice)
+    real_id = resolve_id(choice, accounts)
     if not real_id:
         error(f"❌ Invalid number: {choice}")
         return
@@ -247,20 +248,29 @@ def main():
     else:
         cli_mode()
 
-def resolve_id(input_id):
-    """Resolve ID, supports UUID or index number"""
-    accounts = list_accounts_data()
+def resolve_id(input_id, accounts=None):
+    """Resolve ID, supports UUID or index number
 
-    # 1. Try as index number
+    Args:
+        input_id: UUID or 1-based index as shown by list_accounts
+        accounts: Already loaded account list (from list_accounts), avoids re-reading it
+    """
+    # 1. Try as index number (needs the sorted account list)
     if input_id.isdigit():
+        if accounts is None:
+            accounts = list_accounts_data()
         idx = int(input_id)
         if 1 <= idx <= len(accounts):
             return accounts[idx-1]['id']
+        return None
 
-    # 2. Try as UUID match
-    for acc in accounts:
-        if acc['id'] == input_id:
-            return input_id
+    # 2. Try as UUID match (only needs the IDs)
+    if accounts is not None:
+        account_ids = {acc['id'] for acc in accounts}
+    else:
+        account_ids = list_account_ids()
+    if input_id in account_ids:
+        return input_id
 
     return None
 